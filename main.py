@@ -7,35 +7,49 @@ This github action does some checks on changed files.
 '''
 
 import os
-from pathlib import Path
 import sys
 
-sys.path.insert(0, str(Path(__file__).resolve().parent / 'main'))
-import githooks
+from main import githooks
 
-if __name__ == '__main__':
 
+def main():
+    '''Run the checks on the files changed in the github event'''
     message = os.getenv('INPUT_COMMITMESSAGE')
-
-    print(f'Checking commit {githooks.get_sha()} by {githooks.get_user()} in {githooks.get_branch()}')
-    print(f'Commit message: {message}')
+    meta = githooks.get_commit_metadata()
 
     files = githooks.get_commit_files()
-    print(f'Checking {githooks.get_event()} modified files:')
-    print('  ' + '\n  '.join(files['M']))
-    print(f'Checking {githooks.get_event()} new files:')
-    print('  ' + '\n  '.join(files['A']))
+
+    # Write the banner in one go rather than a print per line
+    sys.stdout.write(
+        f'Checking commit {meta.sha} by {meta.user} in {meta.branch}\n'
+        f'Commit message: {message}\n'
+        f'Checking {meta.event} modified files:\n'
+        '  ' + '\n  '.join(files.modified) + '\n'
+        f'Checking {meta.event} new files:\n'
+        '  ' + '\n  '.join(files.added) + '\n')
 
     retval = 0
+    fail_fast = githooks._fail_fast()
 
-    retval += githooks.check_commit_msg(message, files['M'] + files['A'])
+    retval += githooks.check_commit_msg(message, files.all)
+    if retval and fail_fast:
+        return retval
+    retval += githooks.check_filenames(files.all)
+    if retval and fail_fast:
+        return retval
 
-    if githooks._is_pull_request():
-        retval += githooks.check_do_not_merge(files['M'])
-        retval += githooks.check_do_not_merge(files['A'], new_files=True)
+    # Read each file once for the do not merge, line ending and content checks
+    # Do not merge is only relevant (and only read) in a pull request
+    is_pr = githooks._is_pull_request()
+    eol = githooks.eol_check_needed()
+    retval += githooks.check_all(files.modified, do_not_merge=is_pr, eol=eol)
+    if retval and fail_fast:
+        return retval
+    retval += githooks.check_all(files.added, new_files=True,
+                                 do_not_merge=is_pr, eol=eol)
 
-    retval += githooks.check_filenames(files['M'] + files['A'])
-    retval += githooks.check_eol(files['M'] + files['A'])
-    retval += githooks.check_content(files['M'] + files['A'])
+    return retval
 
-    sys.exit(retval)
+
+if __name__ == '__main__':
+    sys.exit(main())
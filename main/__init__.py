@@ -0,0 +1,4 @@
+'''
+Git hooks and the checks shared with the github action.
+
+'''
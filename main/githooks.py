@@ -4,16 +4,18 @@ Module for a git hook.
 
 '''
 
-from collections import defaultdict
-from io import StringIO
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from unittest.mock import patch
+import atexit
+import functools
+import itertools
 import os
 import platform
 import re
+import shutil
 import subprocess
-import unittest
+import threading
 import sys
 
 
@@ -27,8 +29,8 @@ LARGE_FILE_MARKER = 'LARGE_FILE'
 NO_JIRA_MARKER = 'NO_JIRA'
 # A marker to represent it's a change we don't want to commit
 DO_NOT_COMMIT = 'do not' + ' commit'
-# Check file content if it has these extensions
-CHECKED_EXTS = [
+# Check file content if it has these extensions (case sensitive)
+CHECKED_EXTS = frozenset([
         '.bat',
         '.c',
         '.cgi',
@@ -52,21 +54,103 @@ CHECKED_EXTS = [
         '.sh',
         '.svc',
         '.tpl',
-        ]
+        ])
 # File types that need a terminating newline
-TERMINATING_NEWLINE_EXTS = ['.c', '.cpp', '.h', '.inl']
-
+TERMINATING_NEWLINE_EXTS = frozenset(['.c', '.cpp', '.h', '.inl'])
+# C++ file types checked for common errors
+CPP_EXTS = frozenset(['.cpp', '.h', '.inl'])
+# Values of boolean environment variables that count as set
+TRUTHY_VALUES = frozenset(['1', 'true', 'True', 'TRUE', 'yes'])
+# Use a thread pool to check files if there are more than this number of files
+PARALLEL_FILES_THRESHOLD = 4
+
+# Messages from checks running in a thread pool are held here per thread
+_thread_output = threading.local()
+# Only the first of the threads looking up changed lines runs the git diff
+_changed_lines_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _which(program):
+    '''The full path of a program, or just its name if it can't be found'''
+    return shutil.which(program) or program
+
+
+def _get_output(command, cwd=None):
+    '''Run a command, given as a list of arguments, and return its output'''
+    # With close_fds=False, no shell, no cwd and the full path of the program
+    # python can start the process with posix_spawn rather than fork and
+    # exec, which is much quicker. The child then inherits any inheritable
+    # file descriptors, but python creates file descriptors non-inheritable
+    # by default, so nothing unexpected leaks into the git commands run here.
+    # Keep the default on Windows.
+    # Let subprocess decode the output as it reads it, as _iter_output does
+    return subprocess.check_output([_which(command[0]), *command[1:]],
+                                   cwd=cwd, close_fds=_is_windows(),
+                                   encoding='utf-8', errors='replace')
+
+
+def _iter_output(command, cwd=None):
+    '''Yield the lines output by a command as it runs, see _get_output
+
+    This avoids holding all of a potentially large output in memory.
+    '''
+    with subprocess.Popen([_which(command[0]), *command[1:]], cwd=cwd,
+                          stdout=subprocess.PIPE, close_fds=_is_windows(),
+                          encoding='utf-8', errors='replace') as process:
+        yield from process.stdout
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
 
-def _get_output(command, cwd='.'):
-    return subprocess.check_output(command, shell=True, cwd=cwd).decode(errors='replace')
 
+class _CatFileBatch:
+    '''A long running "git cat-file --batch" process to read git objects
 
+    This saves starting a git process for every file that is read. The
+    process is started on first use and stopped when python exits.
+    '''
+    def __init__(self):
+        self._process = None
+        self._lock = threading.Lock()
+
+    def get_blob(self, ref):
+        '''Return the content of a blob, eg. ":<filename>" for a staged file'''
+        with self._lock:
+            if self._process is None:
+                self._process = subprocess.Popen(
+                        [_which('git'), 'cat-file', '--batch'],
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                        close_fds=_is_windows())
+                atexit.register(self.close)
+            self._process.stdin.write(ref.encode() + b'\n')
+            self._process.stdin.flush()
+            # The header is "<sha> <type> <size>" or "<ref> missing"
+            header = self._process.stdout.readline().split()
+            if header[-1] == b'missing':
+                raise FileNotFoundError(f'{ref} not found by git cat-file')
+            data = self._process.stdout.read(int(header[2]))
+            # Content is followed by a newline
+            self._process.stdout.read(1)
+            return data
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+_cat_file_batch = _CatFileBatch()
+
+
+# The environment and platform don't change while the checks run, so the
+# results of these are cached
+@functools.lru_cache(maxsize=None)
 def _is_github_event():
     if 'GITHUB_EVENT_NAME' in os.environ:
         return True
     return False
 
 
+@functools.lru_cache(maxsize=None)
 def _is_pull_request():
     if os.environ.get('GITHUB_EVENT_NAME', '') == 'pull_request':
         return True
@@ -74,28 +158,97 @@ def _is_pull_request():
         return False
 
 
+def _fail_fast():
+    '''Return True if checks should stop at the first failure
+
+    Set GITHOOKS_FAIL_FAST=1 (or true/yes) to get a failing commit back
+    quickly.
+    '''
+    return os.environ.get('GITHOOKS_FAIL_FAST', '0') in TRUTHY_VALUES
+
+
+def _print(msg):
+    buffer = getattr(_thread_output, 'buffer', None)
+    if buffer is None:
+        print(msg)
+    else:
+        buffer.append(msg)
+
+
 def _skip(filename, msg):
-    print(f'SKIP {filename}: {msg}')
+    _print(f'SKIP {filename}: {msg}')
 
 
 def _fail(msg):
-    print(f'COMMIT FAIL: {msg}')
+    _print(f'COMMIT FAIL: {msg}')
+
+
+def _map_files(func, files):
+    '''Call func on each file and return the results in the same order
 
+    Reading and checking files is mostly I/O bound, so if there are enough
+    files this is done in a thread pool. In that case any output is held back
+    until all files are checked, and then printed in the order of the files.
 
+    If failing fast, files are checked one by one and no more files are
+    checked after the first one for which func returns non zero.
+    '''
+    if _fail_fast():
+        retvals = []
+        for filename in files:
+            retvals.append(func(filename))
+            if retvals[-1]:
+                break
+        return retvals
+
+    if len(files) <= PARALLEL_FILES_THRESHOLD:
+        return [func(filename) for filename in files]
+
+    def _run(filename):
+        _thread_output.buffer = []
+        try:
+            return func(filename), _thread_output.buffer
+        finally:
+            _thread_output.buffer = None
+
+    max_workers = min(16, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_run, files))
+
+    retvals = []
+    for retval, output in results:
+        for msg in output:
+            print(msg)
+        retvals.append(retval)
+    return retvals
+
+
+@functools.lru_cache(maxsize=None)
 def _is_windows():
     return platform.system() == 'Windows'
 
 
+@functools.lru_cache(maxsize=None)
+def _get_local_head():
+    '''Get the current branch and the sha of HEAD locally with one git call'''
+    sha, branch = _get_output(
+        ['git', 'rev-parse', 'HEAD', '--abbrev-ref', 'HEAD']).split()
+    return branch, sha
+
+
+@functools.lru_cache(maxsize=None)
 def get_user():
     '''Get user making the commit'''
     if _is_github_event():
         return os.environ['GITHUB_ACTOR']
     else:
-        output = _get_output('git var GIT_AUTHOR_IDENT')
-        match = re.match(r'^(.+) <', output)
+        output = _get_output(['git', 'var', 'GIT_AUTHOR_IDENT'])
+        match = author_ident_pattern.match(output)
         return match.group(1)
+author_ident_pattern = re.compile(r'^(.+) <')
 
 
+@functools.lru_cache(maxsize=None)
 def get_branch():
     '''Get current branch'''
     if _is_github_event():
@@ -104,41 +257,80 @@ def get_branch():
         else:
             return os.environ['GITHUB_REF'].split('/')[-1]
     else:
-        return _get_output('git branch').split()[-1]
+        return _get_local_head()[0]
 
 
-def get_file_content_as_binary(filename):
-    '''Get content of a file in binary mode
+def get_file_bytes(filename):
+    '''Get the raw content of a file, without decoding it
 
     Locally (ie. non-github event) we return the content of the staged file,
     not the file in the working directory.
     '''
     if _is_github_event() or 'pytest' in sys.modules:
-        try:
-            with open(filename, 'rb') as fileobj:
-                data = fileobj.read().decode()
-        except UnicodeDecodeError:
-            _skip(filename, 'File is not UTF-8 encoded')
-            data = None
+        # The whole file is read at once, so skip the buffered reader
+        with open(filename, 'rb', buffering=0) as fileobj:
+            return fileobj.read()
     else:
-        data = _get_output(f'git show :{filename}')
-    return data
+        return _cat_file_batch.get_blob(f':{filename}')
+
 
+def get_file_sizes(files):
+    '''Get the sizes (in bytes) of files
 
-def get_text_file_content(filename):
-    '''Get content of a text file
+    Locally (ie. non-github event) we return the sizes of the staged files,
+    not the files in the working directory. These are looked up with a single
+    git call.
+
+    :returns: A dictionary of file name to size
+    '''
+    if not files:
+        return {}
+    if _is_github_event() or 'pytest' in sys.modules:
+        return {filename: os.stat(filename).st_size for filename in files}
+    refs = ''.join(f':{filename}\n' for filename in files)
+    output = subprocess.run(
+        [_which('git'), 'cat-file', '--batch-check=%(objectsize)'],
+        input=refs, stdout=subprocess.PIPE, check=True, encoding='utf-8',
+        close_fds=_is_windows()).stdout
+    return dict(zip(files, map(int, output.split())))
+
+
+def _decode_content(filename, raw):
+    '''Decode the raw content of a file, or return None if it's not UTF-8'''
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        _skip(filename, 'File is not UTF-8 encoded')
+        return None
+
+
+def _decode_text(filename, raw):
+    '''Decode the raw content of a file for checking it, or return None
+
+    Binary content is found on the raw bytes, so it's never decoded, and None
+    is returned. It's only reported as skipped if its extension is checked
+    (see CHECKED_EXTS). Any bytes that aren't UTF-8 are replaced, so the rest
+    of the file is still checked. Content that is written back is decoded
+    with _decode_content.
+    '''
+    if b'\0' in raw:
+        if is_checked_file(filename):
+            _skip(filename, 'Not a text file')
+        return None
+    return raw.decode(errors='replace')
+
+
+def get_file_content_as_binary(filename):
+    '''Get content of a file in binary mode, decoded as UTF-8
 
     Locally (ie. non-github event) we return the content of the staged file,
     not the file in the working directory.
     '''
-    if _is_github_event() or 'pytest' in sys.modules:
-        data = Path(filename).read_text()
-    else:
-        data = _get_output(f'git show :{filename}')
-    return data
+    return _decode_content(filename, get_file_bytes(filename))
 
 
-def get_sha():
+@functools.lru_cache(maxsize=None)
+def get_sha(branch=None):
     '''Get the commit sha
 
     The sha of the branch we are interested in, ie. the tip of the branch that
@@ -146,8 +338,14 @@ def get_sha():
 
     GITHUB_SHA cannot be used because in a pull request it gives the sha of the
     fake merge commit.
+
+    :param branch: The current branch if it is already known
     '''
-    return _get_output(f'git rev-parse {get_branch()}')
+    if branch is None:
+        branch = get_branch()
+    if not _is_github_event() and branch == _get_local_head()[0]:
+        return _get_local_head()[1]
+    return _get_output(['git', 'rev-parse', branch]).strip()
 
 
 def get_event():
@@ -158,38 +356,86 @@ def get_event():
         return 'commit'
 
 
-def get_branch_files():
-    '''Get all files in branch'''
+CommitMetadata = namedtuple('CommitMetadata', ['event', 'user', 'branch', 'sha'])
+
+
+def get_commit_metadata():
+    '''Get the event, user, branch and sha of the commit being checked
+
+    The branch is only looked up once and reused to get the sha.
+    '''
     branch = get_branch()
-    return _get_output(f'git ls-tree -r {branch} --name-only').splitlines()
+    return CommitMetadata(get_event(), get_user(), branch, get_sha(branch))
+
+
+def get_branch_files(branch=None):
+    '''Yield all files in branch as git lists them
+
+    :param branch: The current branch if it is already known
+    '''
+    if branch is None:
+        branch = get_branch()
+    for line in _iter_output(
+            ['git', 'ls-tree', '-r', branch, '--name-only']):
+        yield line.rstrip('\n')
 
 
 def add_file_to_index(filename):
     '''Add file to current commit'''
-    return _get_output(f'git add {filename}')
+    return _get_output(['git', 'add', '--', filename])
+
+
+CommitFiles = namedtuple('CommitFiles', ['modified', 'added', 'all'])
+
 
+def parse_name_status(output):
+    '''Parse "git diff --name-status -z" or "git diff-index -z" output
 
+    :param output: The NUL separated output of the git command
+    :returns: a list of (status, path) tuples
+    '''
+    fields = output.split('\0')
+    result = []
+    i = 0
+    while i < len(fields) - 1:
+        # diff-index prefixes the status with the modes and shas
+        status = fields[i].split()[-1]
+        if status[0] in 'RC':
+            # Renames and copies are followed by the old and the new path
+            result.append((status, fields[i+2]))
+            i += 3
+        else:
+            result.append((status, fields[i+1]))
+            i += 2
+    return result
+
+
+@functools.lru_cache(maxsize=None)
 def get_commit_files():
     '''Get files in current commit
 
-    Return a dictionary:
-        'M': <list of modified files>
-        'A': <list of new files>
+    Return a CommitFiles namedtuple:
+        modified: <tuple of modified files>
+        added: <tuple of new files>
+        all: <tuple of modified and new files>
 
+    The files are only looked up once; the result is cached for the rest of
+    the process.
     '''
     if _is_github_event():
         if _is_pull_request():
-            output = _get_output(f'git diff --ignore-submodules --name-status remotes/origin/{os.environ["GITHUB_BASE_REF"]}..remotes/origin/{os.environ["GITHUB_HEAD_REF"]} --')
+            output = _get_output(['git', 'diff', '--ignore-submodules', '--name-status', '-z', f'remotes/origin/{os.environ["GITHUB_BASE_REF"]}..remotes/origin/{os.environ["GITHUB_HEAD_REF"]}', '--'])
         else:
-            output = _get_output('git diff --ignore-submodules --name-status HEAD~.. --')
+            output = _get_output(['git', 'diff', '--ignore-submodules', '--name-status', '-z', 'HEAD~..', '--'])
     else:
-        output = _get_output('git diff-index --ignore-submodules HEAD --cached')
+        output = _get_output(['git', 'diff-index', '--ignore-submodules', '-z', 'HEAD', '--cached'])
     result = defaultdict(list)
-    for line in output.splitlines():
-        parts = line.split()
-        if parts[-2] in ['M', 'A']:
-            result[parts[-2]].append(parts[-1])
-    return result
+    for status, path in parse_name_status(output):
+        if status in ['M', 'A']:
+            result[status].append(path)
+    modified = tuple(result['M'])
+    added = tuple(result['A'])
+    return CommitFiles(modified, added, modified + added)
 
 
 def parse_diff_header(header_line):
@@ -198,31 +444,56 @@ def parse_diff_header(header_line):
     The line number is in relation to the file after the change.
 
     :param header_line: A header in the git diff --unified=0 output
-    :returns: a string that represents either a line number or a range
+    :returns: a range of line numbers (a single line if no lines were added)
     '''
     match = parse_diff_header.pattern.match(header_line)
     start = int(match.group(1))
     if match.group(2):
-        num = int(match.group(3))
-        if num > 0:
-            changed_lines = f'{start}-{start+num-1}'
-        else:
-            changed_lines = str(start)
+        num = max(int(match.group(2)), 1)
     else:
-        changed_lines = str(start)
-    return changed_lines
-parse_diff_header.pattern = re.compile(r'^@@\s[^\s]+\s\+?(\d+)(,(\d+))?\s@@.*')
+        num = 1
+    return range(start, start + num)
+parse_diff_header.pattern = re.compile(r'@@\s\S+\s\+?(\d+)(?:,(\d+))?\s@@')
 
 
-class TestParseDiffHeaderPattern(unittest.TestCase):
-    def test_various_strings(self):
-        def _test(input, output):
-            self.assertEqual(output, parse_diff_header(input))
-        _test('@@ -142 +178 @@', '178')
-        _test('@@ -142 +178,3 @@', '178-180')
-        _test('@@ -142 +178,7 @@', '178-184')
-        _test('@@ -3,0 +3 @@', '3')
-        _test('@@ -1 +0,0 @@', '0')
+def _diff_command(*options):
+    '''The git diff command for the change in the current context'''
+    if _is_github_event():
+        if _is_pull_request():
+            return ['git', 'diff', *options, f'remotes/origin/{os.environ["GITHUB_BASE_REF"]}..remotes/origin/{os.environ["GITHUB_HEAD_REF"]}']
+        return ['git', 'diff', *options, 'HEAD~']
+    return ['git', 'diff-index', 'HEAD', *options]
+
+
+@functools.lru_cache(maxsize=None)
+def get_all_changed_lines():
+    '''New and modified lines in all files in current commit
+
+    This runs a single git diff for the whole change rather than one per
+    file, see get_changed_lines.
+
+    :returns: A dict mapping filenames to lists of ranges of changed lines
+    '''
+    # Fix the prefixes and don't quote non-ascii names, whatever the config
+    command = _diff_command(
+        '--unified=0', '--no-color', '--src-prefix=a/', '--dst-prefix=b/')
+    command[1:1] = ['-c', 'core.quotePath=false']
+    changed_lines = {}
+    file_lines = None
+    in_header = False
+    for line in _iter_output(command):
+        if line.startswith('diff '):
+            in_header = True
+            file_lines = None
+        elif in_header and line.startswith('+++ b/'):
+            # git adds a tab after names with spaces in them
+            filename = line[len('+++ b/'):].rstrip('\n').rstrip('\t')
+            file_lines = changed_lines.setdefault(filename, [])
+        elif line.startswith('@@'):
+            in_header = False
+            if file_lines is not None:
+                file_lines.append(parse_diff_header(line))
+    return changed_lines
 
 
 def get_changed_lines(modified_file):
@@ -234,60 +505,70 @@ def get_changed_lines(modified_file):
         push:           HEAD~ -> HEAD   (ie. previous commit -> current commit)
         precommit:      HEAD -> index   (ie. current commit -> new commit)
 
-    The returned list contains line numbers of lines that have changed. The
-    list can contain ranges. For example ['3','6-9','12'] means lines
-    3,6,7,8,9,12.
+    The returned list contains ranges of line numbers of lines that have
+    changed. For example [range(3, 4), range(6, 10), range(12, 13)] means
+    lines 3,6,7,8,9,12.
 
     :param modified_file: The file which has changed
-    :returns: A list of line number (integers and ranges) of changed lines
+    :returns: A list of ranges of line numbers of changed lines
     '''
-    if _is_github_event():
-        if _is_pull_request():
-            output = _get_output(
-                    f'git diff --unified=0 remotes/origin/{os.environ["GITHUB_BASE_REF"]}..remotes/origin/{os.environ["GITHUB_HEAD_REF"]} -- {modified_file}')
-        else:
-            output = _get_output(
-                    f'git diff --unified=0 HEAD~ {modified_file}')
-    else:
-        output = _get_output(
-                f'git diff-index HEAD --unified=0 {modified_file}')
-
-    lines = []
-    for line in output.splitlines():
-        if not line.startswith('@@'):
-            continue
-        lines.append(parse_diff_header(line))
-    return lines
+    # lru_cache doesn't stop threads running the diff at the same time
+    with _changed_lines_lock:
+        changed_lines = get_all_changed_lines().get(modified_file)
+    if changed_lines is None:
+        # Not in the diff of all files, eg. git quoted its name, so diff it
+        # on its own. Only the hunk headers are needed, so parse the diff as
+        # it's output
+        command = [*_diff_command('--unified=0'), '--', modified_file]
+        changed_lines = [parse_diff_header(line)
+                         for line in _iter_output(command)
+                         if line.startswith('@@')]
+    return changed_lines
 
 
 def yield_changed_lines(changed_lines):
     '''Yield individual line numbers from list returned by get_changed_lines'''
-    for line_num_range in changed_lines:
-        if '-' in line_num_range:
-            start, end = map(int, line_num_range.split('-'))
-        else:
-            start, end = int(line_num_range), int(line_num_range)
-        for line_num in range(start, end+1):
-            yield line_num
-
-
-class TestYieldChangedLines(unittest.TestCase):
-    def test_various_lists(self):
-        def _test(input, output):
-            self.assertListEqual(output, list(yield_changed_lines(input)))
-        _test(['12'], [12])
-        _test(['12-15'], [12,13,14,15])
-        _test(['12-15','44','55-57'], [12,13,14,15,44,55,56,57])
+    return itertools.chain.from_iterable(changed_lines)
 
 
+@functools.lru_cache(maxsize=None)
 def get_config_setting(setting):
     '''Get the value of a config setting'''
     try:
-        return _get_output(f'git config --get {setting}').strip()
+        return _get_output(['git', 'config', '--get', setting]).strip()
     except subprocess.CalledProcessError:
         return None
 
 
+def eol_check_needed():
+    '''Return False if autocrlf is configured as recommended (see check_eol)'''
+    autocrlf = get_config_setting('core.autocrlf')
+    if _is_windows():
+        return autocrlf != 'true'
+    else:
+        return autocrlf != 'input'
+
+
+def check_eol_in_file(filename, raw=None):
+    '''Check a text file does not contain CRLF line endings
+
+    The check is done on the raw bytes, so the file need not be UTF-8.
+
+    :param raw: The raw content of the file if it has already been read
+    '''
+    if raw is None:
+        raw = get_file_bytes(filename)
+
+    # Skip binary file
+    if b'\0' in raw:
+        return 0
+
+    if b'\r\n' in raw:
+        _fail(f'Bad line endings in {filename}')
+        return 1
+    return 0
+
+
 def check_eol(files):
     '''Check line endings if autocrlf is not configured correctly.
 
@@ -299,55 +580,49 @@ def check_eol(files):
 
     Otherwise check all the text files for LF line endings.
     '''
-    autocrlf = get_config_setting('core.autocrlf')
-    if _is_windows():
-        if autocrlf == 'true':
-            return 0
-    else:
-        if autocrlf == 'input':
-            return 0
+    if not files or not eol_check_needed():
+        return 0
 
     # As the client environment is not configured with autocrlf
     # we need to ensure that every text file does not contain CRLF.
     for filename in files:
-        data = get_file_content_as_binary(filename)
-        if data is None:
-            continue
-
-        # Skip binary file
-        if '\0' in data:
-            continue
-
-        if data.find('\r\n') != -1:
-            _fail(f'Bad line endings in {filename}')
+        if check_eol_in_file(filename):
             return 1
     return 0
 
 
-def check_do_not_merge_in_file(filename, new_file=False):
-    '''Check for "do not merge" in a filename'''
-    data = get_file_content_as_binary(filename)
+def check_do_not_merge_in_file(filename, new_file=False, data=None):
+    '''Check for "do not merge" in a filename
+
+    :param data: The content of the file if it has already been read
+    '''
     if data is None:
+        data = _decode_text(filename, get_file_bytes(filename))
+        if data is None:
+            return 0
+
+    # Nothing to find in the changed lines if it's nowhere in the file
+    match = do_not_merge_pattern.search(data)
+    if match is None:
         return 0
-    else:
-        lines = data.splitlines(True)
 
-    if new_file:
-        line_nums = [f'1-{len(lines)}']
-    else:
+    if not new_file:
+        # Count the lines up to each match to see if it's in a changed line
         line_nums = get_changed_lines(filename)
+        line_num = 1
+        pos = 0
+        while match is not None:
+            line_num += data.count('\n', pos, match.start())
+            pos = match.start()
+            if any(line_num in lines for lines in line_nums):
+                break
+            match = do_not_merge_pattern.search(data, match.end())
+        else:
+            return 0
 
-    for line_num in yield_changed_lines(line_nums):
-        try:
-            line = lines[line_num-1]
-        except IndexError as exc:
-            print(f'Error {exc}: {line_num-1} in {filename}')
-            continue
-        if 'do not merge' in line.lower():
-            _fail(f'Found DO NOT MERGE in "{filename}".')
-            return 1
-
-    return 0
+    _fail(f'Found DO NOT MERGE in "{filename}".')
+    return 1
+do_not_merge_pattern = re.compile(r'do not merge', re.IGNORECASE)
 
 
 def check_do_not_merge(files, new_files=False):
@@ -361,44 +636,36 @@ def check_do_not_merge(files, new_files=False):
         2. Fix the issue (eg. by removing the offending file or part from the
            index) before doing "git commit" to complete the merge.
 
+    The files are checked in a thread pool if there are enough of them.
+
     '''
-    retval = 0
-    for filename in files:
-        retval += check_do_not_merge_in_file(filename, new_files)
-    return retval
+    return sum(_map_files(
+        lambda filename: check_do_not_merge_in_file(filename, new_files),
+        files))
 
 
 def trim_trailing_whitespace(string):
     '''Return a string with trailing white spaces removed'''
-    return trim_trailing_whitespace.pattern.sub(r"\1", string)
+    # This is usually a single line, which str.rstrip trims much more quickly
+    # than the regular expression that's needed for several lines
+    if '\n' in string[:-1]:
+        return trim_trailing_whitespace.pattern.sub(r"\1", string)
+    if string.endswith('\r\n'):
+        return string[:-2].rstrip() + '\r\n'
+    if string.endswith('\n'):
+        return string[:-1].rstrip() + '\n'
+    return string.rstrip()
 trim_trailing_whitespace.pattern = re.compile(r"\s*?(\r?\n|$)")
-
-
-class TestTrailingWhitespacePattern(unittest.TestCase):
-    def test_various_strings(self):
-        def _test(input, output=None):
-            if output is None:
-                output = input
-            self.assertEqual(output, trim_trailing_whitespace(input))
-        _test('')
-        _test('\n')
-        _test('\r\n')
-        _test('a')
-        _test(' a')
-        _test('  a')
-        _test('1234')
-        _test(u'abcd\xe9')
-        _test(' ', '')
-        _test(' \n', '\n')
-        _test(' \r\n', '\r\n')
-        _test(' a ', ' a')
-        _test('  a ', '  a')
-        _test(' a \r\n  b   \n c\n ', ' a\r\n  b\n c\n')
-        _test(u'abcd\xe9 ', u'abcd\xe9')
+# Finds (at least) every place where trim_trailing_whitespace would change a
+# line of data.splitlines(True), so if there is no match nothing needs trimming
+trailing_whitespace_pattern = re.compile(
+        r'[^\S\r\n](?=\r?\n|\Z)'                 # white space at end of line
+        r'|\r(?!\n)'                              # CR not part of CRLF
+        r'|[\x0b\x0c\x1c-\x1e\x85\u2028\u2029]')  # other line breaks
 
 
 def trim_trailing_whitespace_in_file(filename, new_file, dry_run,
-                                     add_to_git_index=True):
+                                     add_to_git_index=True, data=None):
     '''Remove trailing white spaces in new and modified lines in a filename
 
     :param filename: The file to check
@@ -409,17 +676,22 @@ def trim_trailing_whitespace_in_file(filename, new_file, dry_run,
         False if the file is to be updated if trailing whitespace is found
     :param add_to_git_index: If dry_run=False, set to False if we don't want to
         automatically add the new file to git index should it be updated
+    :param data: The content of the file if it has already been read
     :returns: If dry_run=True, 0 if no trailing whitespace is found, 1 if
         trailing whitepsace is found.
     '''
-    data = get_file_content_as_binary(filename)
     if data is None:
+        data = get_file_content_as_binary(filename)
+        if data is None:
+            return 0
+
+    # Nothing to trim in the changed lines if there's nothing to trim at all
+    if trailing_whitespace_pattern.search(data) is None:
         return 0
-    else:
-        lines = data.splitlines(True)
+    lines = data.splitlines(True)
 
     if new_file:
-        line_nums = [f'1-{len(lines)}']
+        line_nums = [range(1, len(lines) + 1)]
     else:
         line_nums = get_changed_lines(filename)
 
@@ -430,21 +702,21 @@ def trim_trailing_whitespace_in_file(filename, new_file, dry_run,
         try:
             before = lines[line_num-1]
         except IndexError as exc:
-            print(f'Error {exc}: {line_num} in {filename}')
+            _print(f'Error {exc}: {line_num} in {filename}')
             continue
         after = trim_trailing_whitespace(before)
         if before != after:
             if dry_run:
                 modified_lines.append(str(line_num))
             else:
-                print(f'   Fixed line {filename}:{line_num}')
+                _print(f'   Fixed line {filename}:{line_num}')
                 modified_file = True
                 lines[line_num-1] = after
 
     if modified_file:
-        with open(filename, 'wb') as fileobj:
-            lines = ''.join(lines)
-            fileobj.write(lines.encode())
+        # newline='' writes the line endings as they are
+        with open(filename, 'w', encoding='utf-8', newline='') as fileobj:
+            fileobj.writelines(lines)
         if add_to_git_index:
             add_file_to_index(filename)
 
@@ -456,44 +728,28 @@ def trim_trailing_whitespace_in_file(filename, new_file, dry_run,
     return 0
 
 
-class TestTrimTrailingWhitespace(unittest.TestCase):
-    def test_trim_trailing_whitespace(self):
-        content = 'first line\nsecond line \nthird line '
-        trimmed_content = 'first line\nsecond line\nthird line'
-        with NamedTemporaryFile() as tmp:
-            Path(tmp.name).write_text(content)
-
-            # Trailing whitespace found
-            retval = trim_trailing_whitespace_in_file(tmp.name, True, True)
-            self.assertEqual(retval, 1)
-            self.assertEqual(Path(tmp.name).read_text(), content)
-
-            # Now remove the trailing whitespace
-            trim_trailing_whitespace_in_file(tmp.name, True, False, False)
-            # Trailing whitespace no longer found
-            self.assertEqual(Path(tmp.name).read_text(), trimmed_content)
-            retval = trim_trailing_whitespace_in_file(tmp.name, True, True)
-            self.assertEqual(retval, 0)
-
-    def test_decodeerror(self):
-        # A text file that is not utf-8 encoded - report and skip
-        test_file = Path(__file__).parent / '../test/decode_error.txt'
-        with patch('sys.stdout', new=StringIO()) as tmp_stdout:
-            retval = trim_trailing_whitespace_in_file(test_file, True, True)
-            self.assertEqual(retval, 0)
-            self.assertEqual(tmp_stdout.getvalue().strip(), f'SKIP {test_file}: File is not UTF-8 encoded')
-
-
 def remove_trailing_white_space(files, new_files=False, dry_run=False):
     '''Remove trailing white spaces in all new and modified lines
 
     Set dry_run to True if you just want to check if trailing whitespace exists
     in the file instead of actually updating the file.
+
+    In a dry run the files are checked in a thread pool if there are enough
+    of them. Otherwise they are updated one by one, as updated files are added
+    to the git index and git does not allow that in parallel.
     '''
+    if dry_run:
+        return sum(_map_files(
+            lambda filename: trim_trailing_whitespace_in_file(
+                filename, new_files, dry_run),
+            files))
+
     retval = 0
     for filename in files:
         retval += trim_trailing_whitespace_in_file(filename, new_files,
                                                    dry_run)
+        if retval and _fail_fast():
+            break
     return retval
 
 
@@ -510,8 +766,6 @@ def check_filename(filepath):
     # http://msdn.microsoft.com/en-us/library/windows/desktop/aa365247.aspx#naming_conventions
     # This checks for those cases and stops the commit if found.
 
-    # Filename must not contain these characters
-    ILLEGAL_CHARS = frozenset('\\/:*?"<>|')
     # These names are reserved on Windows
     DEVICE_NAMES = frozenset([
         'con', 'prn', 'aux', 'nul',
@@ -520,10 +774,10 @@ def check_filename(filepath):
         ])
 
     filename = Path(filepath).name
-    for ch in filename:
-        if ch in ILLEGAL_CHARS or ord(ch) <= 31:
-            _fail(f'Illegal character "{ch}" in filename "{filename}".')
-            return 1
+    match = illegal_filename_char_pattern.search(filename)
+    if match:
+        _fail(f'Illegal character "{match.group()}" in filename "{filename}".')
+        return 1
 
     if Path(filename).stem in DEVICE_NAMES:
         _fail(f'Illegal filename "{filename}" - reserved on Windows.\n')
@@ -534,9 +788,7 @@ def check_filename(filepath):
               'names are not permitted to end with "." or whitespace.')
         return 1
 
-    try:
-        filepath.encode('ascii')
-    except UnicodeEncodeError:
+    if not filepath.isascii():
         _fail(f'Illegal path "{filepath}" - '
               'only ASCII characters are permitted.')
         return 1
@@ -547,20 +799,30 @@ def check_filename(filepath):
         return 1
 
     return 0
+# Filename must not contain these characters or control characters
+illegal_filename_char_pattern = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
 
+@functools.lru_cache(maxsize=None)
+def _find_case_collision(branch, files):
+    '''Find a file whose name only differs in case from another file
 
-class TestCheckFileName(unittest.TestCase):
-    def test_various_strings(self):
-        def _test(input, output):
-            self.assertEqual(output, check_filename(input))
-        _test('good/some.txt', 0)
-        _test('bad/illegal/star*star.txt', 1)
-        _test('bad/reserved/device/con.txt', 1)
-        _test('bad/end/period.txt.', 1)
-        _test('bad/end/space.txt ', 1)
-        _test('bad/ascii/你好.txt', 1)
-        _test('long/path/'*20 + 'l208.txt', 0)
-        _test('long/path/'*20 + 'll209.txt', 1)
+    Only files can collide, with each other or with a file in the branch, so
+    just keep those in memory and compare the branch files to them as git
+    lists them. The result is cached for each branch and tuple of files.
+
+    :returns: A (file, other file) tuple, or None if there is no collision
+    '''
+    lower2case = {}
+    for f in files:
+        other = lower2case.setdefault(f.lower(), f)
+        if other != f:
+            return f, other
+    for other in get_branch_files(branch):
+        f = lower2case.get(other.lower())
+        if f is not None and f != other:
+            return f, other
+    return None
 
 
 def check_filenames(files):
@@ -575,24 +837,22 @@ def check_filenames(files):
 
     '''
 
+    if not files:
+        return 0
+
     # This issue is only possible on Linux
     if not _is_windows():
-        manifest_lower2case = {f.lower(): f for f in get_branch_files()}
-        commit_files = get_commit_files()
-        for commit_type in commit_files:
-            for f in commit_files[commit_type]:
-                flower = f.lower()
-                if (flower in manifest_lower2case and
-                        manifest_lower2case[flower] != f):
-                    _fail(f'Case-folding collision between "{f}" and '
-                          f'"{manifest_lower2case[flower]}"')
-                    return 1
-                else:
-                    manifest_lower2case[flower] = f
+        collision = _find_case_collision(get_branch(), get_commit_files().all)
+        if collision is not None:
+            f, other = collision
+            _fail(f'Case-folding collision between "{f}" and "{other}"')
+            return 1
 
     retval = 0
     for filepath in files:
         retval += check_filename(filepath)
+        if retval and _fail_fast():
+            break
     return retval
 
 
@@ -607,7 +867,7 @@ def check_username():
     '''
 
     username = get_user()
-    if re.search(r'root|buildman|[^a-zA-Z ]', username) is not None:
+    if bad_username_pattern.search(username) is not None:
         message = 'Bad username "' + username + '"\n'
         if username == 'buildman' or username == 'root':
             message += 'buildman or root user should not be used'
@@ -617,10 +877,11 @@ def check_username():
         return 1
 
     return 0
+bad_username_pattern = re.compile(r'root|buildman|[^a-zA-Z ]')
 
 
 def check_file_content(filename, data):
-    if DO_NOT_COMMIT in data.lower():
+    if do_not_commit_pattern.search(data) is not None:
         _fail(f'Found {DO_NOT_COMMIT.upper()} in "{filename}".')
         return 1
 
@@ -629,7 +890,8 @@ def check_file_content(filename, data):
         return 1
 
     # For file types that need a terminating newline
-    if any(map(lambda ext: filename.endswith(ext), TERMINATING_NEWLINE_EXTS)):
+    ext = os.path.splitext(filename)[1]
+    if ext in TERMINATING_NEWLINE_EXTS:
         if not data.endswith('\n'):
             _fail(f'Missing terminating newline in {filename}.')
             return 1
@@ -637,130 +899,29 @@ def check_file_content(filename, data):
     # NOTE: Not checking eol
 
     # Detect common C++ errors that the build-checkers have encountered.
-    if any(map(lambda ext: filename.endswith(ext), ['.cpp', '.h', '.inl'])):
-        num = 0
-        for line in data.splitlines():
-            num += 1
-            if cpp_include_backslash_pattern.search(line):
-                _fail(f'{filename}:{num} - Backslash in #include.')
-                return 1
-            if cpp_throw_std_exception_pattern.search(line):
-                _fail(f'{filename}:{num} - std::exception thrown.')
-                return 1
+    # Search the whole file at once and work out the line number of a match.
+    if ext in CPP_EXTS:
+        match = cpp_include_backslash_pattern.search(data)
+        if match:
+            # The match may start on a preceding blank line, so use its end
+            num = data.count('\n', 0, match.end()) + 1
+            _fail(f'{filename}:{num} - Backslash in #include.')
+            return 1
+        match = cpp_throw_std_exception_pattern.search(data)
+        if match:
+            num = data.count('\n', 0, match.start()) + 1
+            _fail(f'{filename}:{num} - std::exception thrown.')
+            return 1
 
     return 0
+do_not_commit_pattern = re.compile(re.escape(DO_NOT_COMMIT), re.IGNORECASE)
 cpp_include_backslash_pattern = re.compile('^\\s*\\#\\s*include\\s*[\\"\\<][^\\"\\>]*\\\\', re.MULTILINE)
 cpp_throw_std_exception_pattern = re.compile(r'\bthrow\s+(std\s*::\s*)?exception\s*\(')
 
 
-class TestCppIncludeBackslashPattern(unittest.TestCase):
-    def test_no_path_separator(self):
-        self.assertIsNone(
-                cpp_include_backslash_pattern.search('#include <iostream>'))
-        self.assertIsNone(
-                cpp_include_backslash_pattern.search('#include "header.h"'))
-
-    def test_commented_out(self):
-        self.assertIsNone(
-                cpp_include_backslash_pattern.search('//#include "a\\b"'))
-
-    def test_multiline(self):
-        self.assertIsNotNone(
-                cpp_include_backslash_pattern.search(
-                    'a\nb\n#include "a\\b"\nc\nd\n'))
-
-    def do_test_with_each_separator(self, *args):
-        good = "/".join(args)
-        bad = "\\".join(args)
-        self.assertIsNone(cpp_include_backslash_pattern.search(good))
-        self.assertIsNotNone(cpp_include_backslash_pattern.search(bad))
-
-    def test_angle_brackets(self):
-        self.do_test_with_each_separator('#include <some', 'path>')
-
-    def test_quotes(self):
-        self.do_test_with_each_separator('#include "another', 'file"')
-
-    def test_unusual_characters(self):
-        self.do_test_with_each_separator(
-                '#include "1', "! 2£$€%^&()", "-_=+[{]};'@#~,.", '`¬¦"')
-
-    def test_space(self):
-        self.do_test_with_each_separator(' #include "a', 'b"')
-        self.do_test_with_each_separator('  #include "c', 'd"')
-        self.do_test_with_each_separator('     #include "e', 'f"')
-        self.do_test_with_each_separator('\t#include "e', 'f"')
-        self.do_test_with_each_separator('# include "g', 'h"')
-        self.do_test_with_each_separator('#  include "i', 'j"')
-        self.do_test_with_each_separator('#include"i', 'j"')
-        self.do_test_with_each_separator('#include<k', 'l>')
-        self.do_test_with_each_separator(
-                '     #      include           "       m      ',
-                '  n        "     ')
-
-    def test_comment(self):
-        self.do_test_with_each_separator(
-                '#include "x', 'y"// back\\slashes\\ in comment')
-
-
-class TestCppThrowStdExceptionPattern(unittest.TestCase):
-    def test_find(self):
-        self.assertIsNotNone(
-                cpp_throw_std_exception_pattern.search(
-                    'throw std::exception();'))
-        self.assertIsNotNone(
-                cpp_throw_std_exception_pattern.search(
-                    'throw exception("string")'))
-        self.assertIsNotNone(
-                cpp_throw_std_exception_pattern.search('throw exception()'))
-        self.assertIsNotNone(
-                cpp_throw_std_exception_pattern.search(
-                    ' {throw exception();}//comment'))
-
-    def test_spaces(self):
-        self.assertIsNotNone(
-                cpp_throw_std_exception_pattern.search(
-                    ' throw  std   ::    exception     (   )  '))
-
-    def test_dont_find_runtime_error(self):
-        self.assertIsNone(
-                cpp_throw_std_exception_pattern.search(
-                    'throw std::runtime_error();'))
-
-    def test_dont_find_variable_named_exception(self):
-        self.assertIsNone(
-                cpp_throw_std_exception_pattern.search('throw exception'))
-        self.assertIsNone(
-                cpp_throw_std_exception_pattern.search('throw exception;'))
-
-    def test_dont_find_catch_exception(self):
-        self.assertIsNone(
-                cpp_throw_std_exception_pattern.search(
-                    'catch (std::exception)'))
-
-    def test_match_word_boundaries(self):
-        self.assertIsNone(
-                cpp_throw_std_exception_pattern.search('throw exceptionblah'))
-        self.assertIsNone(
-                cpp_throw_std_exception_pattern.search('rethrow exception'))
-
-
-class TestCheckFileContent(unittest.TestCase):
-    def test_various_files(self):
-        def _test(filename, is_good, data=None):
-            test_file = Path(__file__).parent / f'../test/{filename}'
-            if data is None:
-                data = get_file_content(str(test_file))
-            retval = check_file_content(filename, data)
-            self.assertEqual(retval == 0, is_good)
-        def _test_good_file(filename, data=None):
-            _test(filename, True, data=data)
-        def _test_bad_file(filename, data=None):
-            _test(filename, False, data=data)
-        _test_bad_file('do_not_commit.py', data='do not ' + 'commit')
-        _test_bad_file('tab.py', data='field\tfield')
-        _test_bad_file('no_newline.cpp', data='No terminating newline')
-        _test_good_file('good_file.cpp')
+def is_checked_file(filename):
+    '''Return True if the content of the file should be checked'''
+    return os.path.splitext(filename)[1] in CHECKED_EXTS
 
 
 def get_file_content(filename):
@@ -774,24 +935,35 @@ def get_file_content(filename):
     Otherwise return None
     '''
     # Skip file if extension is not in the checked list
-    if not any([filename.endswith(checked_ext)
-                for checked_ext in CHECKED_EXTS]):
+    if not is_checked_file(filename):
         return
 
     # NOTE: ignored_patterns not implemented
 
     try:
-        data = get_text_file_content(filename)
+        raw = get_file_bytes(filename)
     except Exception as exc:
-        print(f'Error "{exc}" while reading {filename}')
+        _print(f'Error "{exc}" while reading {filename}')
         return
 
-    # Skip binary file
-    if '\0' in data:
-        _skip(filename, 'Not a text file')
-        return
+    return _decode_text(filename, raw)
 
-    return data
+
+def check_content_in_file(filename, data=None):
+    '''Check content of a file, see check_content
+
+    :param data: The content of the file if it has already been read
+    '''
+    if data is None:
+        data = get_file_content(filename)
+        if data is None:
+            return 0
+    elif not is_checked_file(filename):
+        return 0
+    elif '\0' in data:
+        _skip(filename, 'Not a text file')
+        return 0
+    return check_file_content(filename, data)
 
 
 def check_content(files):
@@ -810,17 +982,63 @@ def check_content(files):
             b. It has no backslash in #include
             c. It does not throw std::exception
 
+    The files are checked in a thread pool if there are enough of them.
+
     '''
-    retval = 0
+    return sum(_map_files(check_content_in_file, files))
 
-    for filename in files:
-        data = get_file_content(filename)
-        if data is not None:
-            retval += check_file_content(filename, data)
 
+def check_all_in_file(filename, new_file=False, do_not_merge=False, eol=True):
+    '''Run do not merge, line ending and content checks reading the file once
+
+    :param filename: The file to check
+    :param new_file: True if whole file is new; False if it's an existing
+        file that's been modified
+    :param do_not_merge: True to check for "do not merge"
+    :param eol: True to check line endings
+    '''
+    # Content is only checked in files with checked extensions, so don't read
+    # or decode any other file unless it's needed for line endings or do not
+    # merge
+    checked = is_checked_file(filename)
+    if not (eol or do_not_merge or checked):
+        return 0
+
+    raw = get_file_bytes(filename)
+
+    retval = 0
+    if eol:
+        retval += check_eol_in_file(filename, raw)
+    if not (do_not_merge or checked):
+        return retval
+
+    data = _decode_text(filename, raw)
+    if data is None:
+        return retval
+    if do_not_merge:
+        retval += check_do_not_merge_in_file(filename, new_file, data)
+    retval += check_content_in_file(filename, data)
     return retval
 
 
+def check_all(files, new_files=False, do_not_merge=False, eol=None):
+    '''Run check_do_not_merge, check_eol and check_content on files
+
+    Each file is only read once for all the checks.
+
+    :param eol: True to check line endings, None to only check them if
+        autocrlf is not configured as recommended (see eol_check_needed)
+    '''
+    if not files:
+        return 0
+    if eol is None:
+        eol = eol_check_needed()
+    return sum(_map_files(
+        lambda filename: check_all_in_file(filename, new_files,
+                                           do_not_merge, eol),
+        files))
+
+
 def check_commit_msg(message, files):
     '''Check commit message (and file size).
 
@@ -830,11 +1048,11 @@ def check_commit_msg(message, files):
     does not contain required marker.
 
     '''
-    if re.match(r'^Merge ((remote-tracking )?branch|commit) \'.+?\'( of [^\s]+)? into .+', message):
+    if merge_branch_pattern.match(message):
         # Not checking for JIRA or large file in commit message generated by github
         return 0
 
-    if re.match(r'^Merge pull request #.+ from .+', message):
+    if merge_pull_request_pattern.match(message):
         # Not checking for JIRA or large file in commit message generated by github
         return 0
 
@@ -844,58 +1062,25 @@ def check_commit_msg(message, files):
                   f'{NO_JIRA_MARKER}')
             return 1
 
+    # Compare sizes in bytes, and only look for large files that the message
+    # doesn't allow once
+    hard_limit = HARD_SIZE_THRESHOLD * 1024**2
+    soft_limit = (hard_limit if LARGE_FILE_MARKER in message
+                  else SOFT_SIZE_THRESHOLD * 1024**2)
+    sizes = get_file_sizes(files)
     for filename in files:
-        size = Path(filename).stat().st_size / 1024**2
-        if size > HARD_SIZE_THRESHOLD:
-            _fail(f'{filename} is larger than the github limit.')
-            return 1
-        elif size > SOFT_SIZE_THRESHOLD:
-            if LARGE_FILE_MARKER not in message:
+        size = sizes[filename]
+        if size > soft_limit:
+            if size > hard_limit:
+                _fail(f'{filename} is larger than the github limit.')
+            else:
                 _fail(f'{filename} is larger than {SOFT_SIZE_THRESHOLD}MB.')
-                return 1
+            return 1
 
     return 0
 jira_id_pattern = re.compile(r'\b[A-Z]{2,8}-[0-9]{1,5}\b')
-
-
-class TestJiraIDPattern(unittest.TestCase):
-    def test_various_strings(self):
-        def _test(input, is_jira=True):
-            m = jira_id_pattern.search(input)
-            self.assertEqual(bool(m), is_jira)
-        _test('BLD-5704')
-        _test('CQ-1')
-        _test('CQ-12345')
-        _test('SKETCHER-1')
-        _test('SKETCHER-12345')
-        _test("BLD-1234 fixed some builds")
-        _test("fixed some builds BLD-1234 ")
-        _test("fixed some builds (Jira BLD-1234)")
-        _test("fixed some builds\n some more text BLD-1234")
-        _test('lower-1234', False)
-        _test('A-1234', False)
-        _test('ABCDEFGHI-1234', False)
-        _test('BLD-123456', False)
-        _test('wordBLD-1234', False)
-        _test('BLD-1234word', False)
-
-
-class TestCheckCommitMessage(unittest.TestCase):
-    def test_various_strings(self):
-        def _test(input, is_good=True):
-            rc = check_commit_msg(input, [])
-            self.assertEqual(rc == 0, is_good)
-        _test('ABC-1234')
-        _test('Some changes for ABC-1234 ticket')
-        _test('Trivial change NO_JIRA')
-        _test("Merge branch 'main' into my_branch")
-        _test("Merge branch 'branch_1' into branch_2")
-        _test("Merge branch 'jira_pyapi_123_abc' of github.com:ccdc-confidential/cpp-apps-main into jira_pyapi_123_abc")
-        _test("Merge commit 'abcdef' into jira_mer_123_abc")
-        _test("Merge remote-tracking branch 'origin/release/2022.1' into merge_from_release")
-        _test("Merge pull request #1 from patch-1")
-        _test('I forgot to add the jira marker!', False)
-        _test('Close but no cigar abc-1234', False)
+merge_branch_pattern = re.compile(r'^Merge ((remote-tracking )?branch|commit) \'.+?\'( of [^\s]+)? into .+')
+merge_pull_request_pattern = re.compile(r'^Merge pull request #.+ from .+')
 
 
 def commit_hook(merge=False):
@@ -904,20 +1089,28 @@ def commit_hook(merge=False):
 
     print(' Check username ...')
     retval += check_username()
+    if retval and _fail_fast():
+        return retval
 
     if merge:
         print(' Check do not merge ...')
-        retval += check_do_not_merge(files['M'])
-        retval += check_do_not_merge(files['A'], new_files=True)
+        retval += check_do_not_merge(files.modified)
+        if retval and _fail_fast():
+            return retval
+        retval += check_do_not_merge(files.added, new_files=True)
     else:
         print(' Check filenames ...')
-        retval += check_filenames(files['M'] + files['A'])
-
-        print(' Check line endings ...')
-        retval += check_eol(files['M'] + files['A'])
-
-        print(' Check file content ...')
-        retval += check_content(files['M'] + files['A'])
+        retval += check_filenames(files.all)
+        if retval and _fail_fast():
+            return retval
+
+        # Decide once whether line endings need checking at all
+        eol = eol_check_needed()
+        if eol:
+            print(' Check line endings and file content ...')
+        else:
+            print(' Check file content ...')
+        retval += check_all(files.all, eol=eol)
 
     return retval
 
@@ -928,6 +1121,6 @@ def commit_msg_hook():
     commit_message = Path(sys.argv[1]).read_text()
 
     print(' Check commit message ...')
-    retval += check_commit_msg(commit_message, files['M'] + files['A'])
+    retval += check_commit_msg(commit_message, files.all)
 
     return retval
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+'''
+Tests for the githooks module.
+
+'''
+
+from io import StringIO
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from unittest.mock import patch
+import os
+import time
+import unittest
+
+from main.githooks import (
+        PARALLEL_FILES_THRESHOLD,
+        _fail,
+        _map_files,
+        get_all_changed_lines,
+        get_changed_lines,
+        check_all_in_file,
+        check_commit_msg,
+        check_content_in_file,
+        check_do_not_merge_in_file,
+        check_eol_in_file,
+        check_file_content,
+        check_filename,
+        cpp_include_backslash_pattern,
+        cpp_throw_std_exception_pattern,
+        get_file_content,
+        jira_id_pattern,
+        parse_diff_header,
+        parse_name_status,
+        trailing_whitespace_pattern,
+        trim_trailing_whitespace,
+        trim_trailing_whitespace_in_file,
+        yield_changed_lines,
+        )
+
+
+class NoDecodeBytes(bytes):
+    '''Raw file content that fails the test if it's decoded'''
+    def decode(self, *args, **kwargs):
+        raise AssertionError('Binary content was decoded')
+
+
+class TestParseNameStatus(unittest.TestCase):
+    def test_various_outputs(self):
+        def _test(input, output):
+            self.assertListEqual(output, parse_name_status(input))
+        _test('', [])
+        _test('M\0a.py\0A\0b c.py\0', [('M', 'a.py'), ('A', 'b c.py')])
+        _test('R100\0old.py\0new.py\0D\0gone.py\0',
+              [('R100', 'new.py'), ('D', 'gone.py')])
+        _test(':100644 100644 abc123 000000 M\0a.py\0'
+              ':000000 100644 000000 000000 A\0b.py\0',
+              [('M', 'a.py'), ('A', 'b.py')])
+
+
+class TestParseDiffHeaderPattern(unittest.TestCase):
+    def test_various_strings(self):
+        def _test(input, output):
+            self.assertEqual(output, parse_diff_header(input))
+        _test('@@ -142 +178 @@', range(178, 179))
+        _test('@@ -142 +178,3 @@', range(178, 181))
+        _test('@@ -142 +178,7 @@', range(178, 185))
+        _test('@@ -3,0 +3 @@', range(3, 4))
+        _test('@@ -1 +0,0 @@', range(0, 1))
+        _test('@@ -10,2 +12,2 @@ int main()', range(12, 14))
+
+
+class TestYieldChangedLines(unittest.TestCase):
+    def test_various_lists(self):
+        def _test(input, output):
+            self.assertListEqual(output, list(yield_changed_lines(input)))
+        _test([range(12, 13)], [12])
+        _test([range(12, 16)], [12,13,14,15])
+        _test([range(12, 16), range(44, 45), range(55, 58)],
+              [12,13,14,15,44,55,56,57])
+
+
+class TestGetChangedLines(unittest.TestCase):
+    def test_one_diff_in_thread_pool(self):
+        files = [f'file{i}.py' for i in range(PARALLEL_FILES_THRESHOLD + 8)]
+        diff = []
+        for f in files:
+            diff += [f'diff --git a/{f} b/{f}\n', f'--- a/{f}\n',
+                     f'+++ b/{f}\n', '@@ -1 +1,2 @@\n', '+a\n', '+b\n']
+        commands = []
+        def _iter_output(command):
+            commands.append(command)
+            time.sleep(0.05)
+            return iter(diff)
+        get_all_changed_lines.cache_clear()
+        try:
+            with patch('main.githooks._iter_output', new=_iter_output):
+                retvals = _map_files(get_changed_lines, files)
+        finally:
+            get_all_changed_lines.cache_clear()
+        self.assertEqual(len(commands), 1)
+        self.assertListEqual(retvals, [[range(1, 3)]] * len(files))
+
+
+class TestCheckEolInFile(unittest.TestCase):
+    def test_various_contents(self):
+        def _test(raw, retval):
+            with patch('sys.stdout', new=StringIO()):
+                self.assertEqual(check_eol_in_file('file.txt', raw), retval)
+        _test(b'a\nb\n', 0)
+        _test(b'a\r\nb\n', 1)
+        _test(b'\0a\r\nb\n', 0)
+        # Binary files are skipped without a message
+        with patch('sys.stdout', new=StringIO()) as tmp_stdout:
+            check_eol_in_file('file.bin', b'\0' * 100000 + b'\r\n')
+            self.assertEqual(tmp_stdout.getvalue(), '')
+        _test(b'\xe9\r\n', 1)
+
+class TestCheckDoNotMergeInFile(unittest.TestCase):
+    def test_various_contents(self):
+        def _test(data, changed_lines, retval):
+            with patch('main.githooks.get_changed_lines',
+                       return_value=changed_lines), \
+                    patch('sys.stdout', new=StringIO()):
+                self.assertEqual(
+                    check_do_not_merge_in_file('file.txt', data=data), retval)
+        data = 'a\nDo Not Merge\nb\ndo not merge\nc\n'
+        _test('a\nb\n', [range(1, 3)], 0)
+        _test(data, [range(2, 3)], 1)
+        _test(data, [range(4, 5)], 1)
+        _test(data, [range(1, 2), range(3, 4), range(5, 6)], 0)
+        _test(data, [], 0)
+
+    def test_new_file(self):
+        with patch('sys.stdout', new=StringIO()):
+            self.assertEqual(check_do_not_merge_in_file(
+                'file.txt', new_file=True, data='a\ndo not merge\n'), 1)
+            self.assertEqual(check_do_not_merge_in_file(
+                'file.txt', new_file=True, data='a\nb\n'), 0)
+
+    def test_binary_file(self):
+        raw = NoDecodeBytes(b'\0\xff do not merge\n')
+        with patch('main.githooks.get_file_bytes', return_value=raw):
+            self.assertEqual(
+                check_do_not_merge_in_file('file.bin', new_file=True), 0)
+
+
+class TestTrailingWhitespacePattern(unittest.TestCase):
+    def test_various_strings(self):
+        def _test(input, output=None):
+            if output is None:
+                output = input
+            self.assertEqual(output, trim_trailing_whitespace(input))
+        _test('')
+        _test('\n')
+        _test('\r\n')
+        _test('a')
+        _test(' a')
+        _test('  a')
+        _test('1234')
+        _test(u'abcd\xe9')
+        _test(' ', '')
+        _test(' \n', '\n')
+        _test(' \r\n', '\r\n')
+        _test(' a ', ' a')
+        _test('  a ', '  a')
+        _test(' a \r\n  b   \n c\n ', ' a\r\n  b\n c\n')
+        _test(u'abcd\xe9 ', u'abcd\xe9')
+
+    def test_trailing_whitespace_pattern(self):
+        def _test(data):
+            lines = data.splitlines(True)
+            changed = any(trim_trailing_whitespace(line) != line
+                          for line in lines)
+            if changed:
+                self.assertIsNotNone(trailing_whitespace_pattern.search(data))
+        for data in ['', '\n', 'a\nb\n', 'a\r\nb\r\n', 'a \nb', 'a\nb ',
+                     'a\t\r\n', 'a\r\r\n', 'a\rb', 'a\x0cb', 'a\n\n\n',
+                     ' a\n  b\n', 'a\r', 'a\u2028b', 'a \r\nb']:
+            _test(data)
+        self.assertIsNone(trailing_whitespace_pattern.search('a\nb\n\n c\n'))
+        self.assertIsNone(trailing_whitespace_pattern.search('a\r\n\r\nb'))
+
+
+class TestTrimTrailingWhitespace(unittest.TestCase):
+    def test_trim_trailing_whitespace(self):
+        content = 'first line\nsecond line \nthird line '
+        trimmed_content = 'first line\nsecond line\nthird line'
+        with NamedTemporaryFile() as tmp:
+            Path(tmp.name).write_text(content)
+
+            # Trailing whitespace found
+            retval = trim_trailing_whitespace_in_file(tmp.name, True, True)
+            self.assertEqual(retval, 1)
+            self.assertEqual(Path(tmp.name).read_text(), content)
+
+            # Now remove the trailing whitespace
+            trim_trailing_whitespace_in_file(tmp.name, True, False, False)
+            # Trailing whitespace no longer found
+            self.assertEqual(Path(tmp.name).read_text(), trimmed_content)
+            retval = trim_trailing_whitespace_in_file(tmp.name, True, True)
+            self.assertEqual(retval, 0)
+
+    def test_decodeerror(self):
+        # A text file that is not utf-8 encoded - report and skip
+        test_file = Path(__file__).parent / '../test/decode_error.txt'
+        with patch('sys.stdout', new=StringIO()) as tmp_stdout:
+            retval = trim_trailing_whitespace_in_file(test_file, True, True)
+            self.assertEqual(retval, 0)
+            self.assertEqual(tmp_stdout.getvalue().strip(), f'SKIP {test_file}: File is not UTF-8 encoded')
+
+
+class TestCheckFileName(unittest.TestCase):
+    def test_various_strings(self):
+        def _test(input, output):
+            self.assertEqual(output, check_filename(input))
+        _test('good/some.txt', 0)
+        _test('bad/illegal/star*star.txt', 1)
+        _test('bad/illegal/colon:colon.txt', 1)
+        _test('bad/illegal/control\x1fchar.txt', 1)
+        _test('bad/reserved/device/con.txt', 1)
+        _test('bad/end/period.txt.', 1)
+        _test('bad/end/space.txt ', 1)
+        _test('bad/ascii/你好.txt', 1)
+        _test('long/path/'*20 + 'l208.txt', 0)
+        _test('long/path/'*20 + 'll209.txt', 1)
+
+
+class TestCppIncludeBackslashPattern(unittest.TestCase):
+    def test_no_path_separator(self):
+        self.assertIsNone(
+                cpp_include_backslash_pattern.search('#include <iostream>'))
+        self.assertIsNone(
+                cpp_include_backslash_pattern.search('#include "header.h"'))
+
+    def test_commented_out(self):
+        self.assertIsNone(
+                cpp_include_backslash_pattern.search('//#include "a\\b"'))
+
+    def test_multiline(self):
+        self.assertIsNotNone(
+                cpp_include_backslash_pattern.search(
+                    'a\nb\n#include "a\\b"\nc\nd\n'))
+
+    def do_test_with_each_separator(self, *args):
+        good = "/".join(args)
+        bad = "\\".join(args)
+        self.assertIsNone(cpp_include_backslash_pattern.search(good))
+        self.assertIsNotNone(cpp_include_backslash_pattern.search(bad))
+
+    def test_angle_brackets(self):
+        self.do_test_with_each_separator('#include <some', 'path>')
+
+    def test_quotes(self):
+        self.do_test_with_each_separator('#include "another', 'file"')
+
+    def test_unusual_characters(self):
+        self.do_test_with_each_separator(
+                '#include "1', "! 2£$€%^&()", "-_=+[{]};'@#~,.", '`¬¦"')
+
+    def test_space(self):
+        self.do_test_with_each_separator(' #include "a', 'b"')
+        self.do_test_with_each_separator('  #include "c', 'd"')
+        self.do_test_with_each_separator('     #include "e', 'f"')
+        self.do_test_with_each_separator('\t#include "e', 'f"')
+        self.do_test_with_each_separator('# include "g', 'h"')
+        self.do_test_with_each_separator('#  include "i', 'j"')
+        self.do_test_with_each_separator('#include"i', 'j"')
+        self.do_test_with_each_separator('#include<k', 'l>')
+        self.do_test_with_each_separator(
+                '     #      include           "       m      ',
+                '  n        "     ')
+
+    def test_comment(self):
+        self.do_test_with_each_separator(
+                '#include "x', 'y"// back\\slashes\\ in comment')
+
+
+class TestCppThrowStdExceptionPattern(unittest.TestCase):
+    def test_find(self):
+        self.assertIsNotNone(
+                cpp_throw_std_exception_pattern.search(
+                    'throw std::exception();'))
+        self.assertIsNotNone(
+                cpp_throw_std_exception_pattern.search(
+                    'throw exception("string")'))
+        self.assertIsNotNone(
+                cpp_throw_std_exception_pattern.search('throw exception()'))
+        self.assertIsNotNone(
+                cpp_throw_std_exception_pattern.search(
+                    ' {throw exception();}//comment'))
+
+    def test_spaces(self):
+        self.assertIsNotNone(
+                cpp_throw_std_exception_pattern.search(
+                    ' throw  std   ::    exception     (   )  '))
+
+    def test_dont_find_runtime_error(self):
+        self.assertIsNone(
+                cpp_throw_std_exception_pattern.search(
+                    'throw std::runtime_error();'))
+
+    def test_dont_find_variable_named_exception(self):
+        self.assertIsNone(
+                cpp_throw_std_exception_pattern.search('throw exception'))
+        self.assertIsNone(
+                cpp_throw_std_exception_pattern.search('throw exception;'))
+
+    def test_dont_find_catch_exception(self):
+        self.assertIsNone(
+                cpp_throw_std_exception_pattern.search(
+                    'catch (std::exception)'))
+
+    def test_match_word_boundaries(self):
+        self.assertIsNone(
+                cpp_throw_std_exception_pattern.search('throw exceptionblah'))
+        self.assertIsNone(
+                cpp_throw_std_exception_pattern.search('rethrow exception'))
+
+
+class TestCheckFileContent(unittest.TestCase):
+    def test_various_files(self):
+        def _test(filename, is_good, data=None):
+            test_file = Path(__file__).parent / f'../test/{filename}'
+            if data is None:
+                data = get_file_content(str(test_file))
+            retval = check_file_content(filename, data)
+            self.assertEqual(retval == 0, is_good)
+        def _test_good_file(filename, data=None):
+            _test(filename, True, data=data)
+        def _test_bad_file(filename, data=None):
+            _test(filename, False, data=data)
+        _test_bad_file('do_not_commit.py', data='do not ' + 'commit')
+        _test_bad_file('tab.py', data='field\tfield')
+        _test_bad_file('no_newline.cpp', data='No terminating newline')
+        _test_good_file('good_file.cpp')
+
+    def test_cpp_line_numbers(self):
+        def _test(data, output):
+            with patch('sys.stdout', new=StringIO()) as tmp_stdout:
+                self.assertEqual(check_file_content('a.cpp', data), 1)
+                self.assertEqual(tmp_stdout.getvalue().strip(),
+                                 f'COMMIT FAIL: {output}')
+        _test('#include "a\\b"\n', 'a.cpp:1 - Backslash in #include.')
+        _test('int a;\n\n  \n#include "a\\b"\n',
+              'a.cpp:4 - Backslash in #include.')
+        _test('int a;\n{throw exception();}\n',
+              'a.cpp:2 - std::exception thrown.')
+
+
+class TestCheckAll(unittest.TestCase):
+    def test_various_files(self):
+        good_file = str(Path(__file__).parent / '../test/good_file.cpp')
+        self.assertEqual(check_all_in_file(good_file, True, True), 0)
+        with NamedTemporaryFile(suffix='.py') as tmp:
+            Path(tmp.name).write_bytes(b'do not ' + b'merge\r\n')
+            self.assertEqual(check_all_in_file(tmp.name, True, False, False), 0)
+            self.assertEqual(check_all_in_file(tmp.name, True, True, False), 1)
+            self.assertEqual(check_all_in_file(tmp.name, True, True, True), 2)
+        # Content that isn't UTF-8 is still checked
+        with NamedTemporaryFile(suffix='.cpp') as tmp:
+            Path(tmp.name).write_bytes(b'caf\xe9\tbar\n')
+            with patch('sys.stdout', new=StringIO()) as tmp_stdout:
+                self.assertEqual(check_all_in_file(tmp.name, True), 1)
+                self.assertEqual(check_content_in_file(tmp.name), 1)
+            self.assertIn('Found tab characters', tmp_stdout.getvalue())
+        # Binary content is neither decoded nor checked
+        raw = NoDecodeBytes(b'\0\xff\tdo not merge\n')
+        with patch('main.githooks.get_file_bytes', return_value=raw), \
+                patch('sys.stdout', new=StringIO()) as tmp_stdout:
+            self.assertEqual(check_all_in_file('file.cpp', True, True, True), 0)
+            self.assertIsNone(get_file_content('file.cpp'))
+        self.assertListEqual(tmp_stdout.getvalue().splitlines(),
+                             ['SKIP file.cpp: Not a text file'] * 2)
+        # A large binary file is only checked for line endings, and its
+        # content is never decoded
+        raw = NoDecodeBytes(b'\0' * (50 * 1024**2) + b'\r\n')
+        with patch('main.githooks.get_file_bytes', return_value=raw):
+            for filename in ['file.png', 'file.cpp']:
+                with patch('sys.stdout', new=StringIO()):
+                    self.assertEqual(
+                        check_all_in_file(filename, True, True, True), 0)
+        # Other files are only decoded to look for do not merge
+        raw = NoDecodeBytes(b'notes\n')
+        with patch('main.githooks.get_file_bytes', return_value=raw):
+            self.assertEqual(check_all_in_file('file.txt', True, False, True), 0)
+        # Line endings are checked whatever the extension
+        with NamedTemporaryFile(suffix='.txt') as tmp:
+            Path(tmp.name).write_bytes(b'notes\r\n')
+            with patch('sys.stdout', new=StringIO()):
+                self.assertEqual(
+                    check_all_in_file(tmp.name, True, False, True), 1)
+                self.assertEqual(
+                    check_all_in_file(tmp.name, True, False, False), 0)
+        # Other files are not read unless line endings or do not merge are
+        # checked
+        self.assertEqual(check_all_in_file('missing.png', True, False, False), 0)
+
+
+class TestMapFiles(unittest.TestCase):
+    def test_output_in_file_order(self):
+        def _check(filename):
+            _fail(filename)
+            return len(filename)
+        for num in [1, PARALLEL_FILES_THRESHOLD + 10]:
+            files = [str(i) for i in range(num)]
+            with patch('sys.stdout', new=StringIO()) as tmp_stdout:
+                retvals = _map_files(_check, files)
+            self.assertListEqual(retvals, [len(f) for f in files])
+            self.assertListEqual(tmp_stdout.getvalue().splitlines(),
+                                 [f'COMMIT FAIL: {f}' for f in files])
+
+    def test_fail_fast(self):
+        files = [str(i) for i in range(PARALLEL_FILES_THRESHOLD + 10)]
+        with patch.dict(os.environ, {'GITHOOKS_FAIL_FAST': '1'}):
+            retvals = _map_files(lambda f: int(f == '2'), files)
+        self.assertListEqual(retvals, [0, 0, 1])
+
+
+class TestJiraIDPattern(unittest.TestCase):
+    def test_various_strings(self):
+        def _test(input, is_jira=True):
+            m = jira_id_pattern.search(input)
+            self.assertEqual(bool(m), is_jira)
+        _test('BLD-5704')
+        _test('CQ-1')
+        _test('CQ-12345')
+        _test('SKETCHER-1')
+        _test('SKETCHER-12345')
+        _test("BLD-1234 fixed some builds")
+        _test("fixed some builds BLD-1234 ")
+        _test("fixed some builds (Jira BLD-1234)")
+        _test("fixed some builds\n some more text BLD-1234")
+        _test('lower-1234', False)
+        _test('A-1234', False)
+        _test('ABCDEFGHI-1234', False)
+        _test('BLD-123456', False)
+        _test('wordBLD-1234', False)
+        _test('BLD-1234word', False)
+
+
+class TestCheckCommitMessage(unittest.TestCase):
+    def test_various_strings(self):
+        def _test(input, is_good=True):
+            rc = check_commit_msg(input, [])
+            self.assertEqual(rc == 0, is_good)
+        _test('ABC-1234')
+        _test('Some changes for ABC-1234 ticket')
+        _test('Trivial change NO_JIRA')
+        _test("Merge branch 'main' into my_branch")
+        _test("Merge branch 'branch_1' into branch_2")
+        _test("Merge branch 'jira_pyapi_123_abc' of github.com:ccdc-confidential/cpp-apps-main into jira_pyapi_123_abc")
+        _test("Merge commit 'abcdef' into jira_mer_123_abc")
+        _test("Merge remote-tracking branch 'origin/release/2022.1' into merge_from_release")
+        _test("Merge pull request #1 from patch-1")
+        _test('I forgot to add the jira marker!', False)
+        _test('Close but no cigar abc-1234', False)
+
+    def test_file_sizes(self):
+        def _test(message, size, is_good=True):
+            with patch('main.githooks.get_file_sizes',
+                       return_value={'file.bin': size * 1024**2}), \
+                    patch('sys.stdout', new=StringIO()):
+                rc = check_commit_msg(message, ['file.bin'])
+            self.assertEqual(rc == 0, is_good)
+        _test('ABC-1234', 1)
+        _test('ABC-1234', 10, False)
+        _test('ABC-1234 LARGE_FILE', 10)
+        _test('ABC-1234 LARGE_FILE', 100, False)